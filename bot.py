@@ -4,6 +4,14 @@ import json
 import logging
 import asyncio
 import re
+import time
+import hashlib
+import uuid
+import sqlite3
+import threading
+import multiprocessing
+from bisect import bisect
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from datetime import time as datetime_time
 from pytz import timezone
@@ -46,6 +54,19 @@ CHAT_ID = int(os.getenv("CHAT_ID", "0"))
 IMAP_USER = os.getenv("IMAP_USER")
 IMAP_PASS = os.getenv("IMAP_PASS")
 STATE_FILE = 'state.json'
+IMAP_HOST = 'imap.gmail.com'
+
+# Sharded worker mode (WORKERS=0 keeps everything in this process)
+WORKERS = int(os.getenv("WORKERS", "0"))
+MAILBOXES_FILE = os.getenv("MAILBOXES_FILE")
+SHARD_DB = os.getenv("SHARD_DB", "mail.db")
+WORKER_POLL = int(os.getenv("WORKER_POLL", "10"))  # seconds
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "4"))
+LEASE_TTL = int(os.getenv("LEASE_TTL", "120"))  # seconds
+IMAP_TIMEOUT = int(os.getenv("IMAP_TIMEOUT", "60"))  # seconds
+RING_REPLICAS = 64
+OUTBOX_CLAIM_TTL = 600  # seconds before an unacknowledged delivery is retried
+OUTBOX_BATCH = 50  # emails per claim, small enough to send well within OUTBOX_CLAIM_TTL
 
 # Default state structure
 DEFAULT_STATE = {
@@ -101,99 +122,126 @@ def decode_mime_header(header):
     return ''.join(decoded_parts)
 
 
-# Mail checker logic
-def check_mail():
-    global state
-    try:
-        with IMAPClient('imap.gmail.com', ssl=True) as client:
-            client.login(IMAP_USER, IMAP_PASS)
-            client.select_folder('INBOX')
-            all_uids = client.search(['ALL'])
-
-            if not all_uids:
-                logger.info("No emails found in inbox")
-                return []
-
-            # Get highest UID to update last_uid
-            max_uid = max(all_uids)
-            if max_uid <= state['last_uid']:
-                logger.info(f"No new emails since last check (last_uid={state['last_uid']}, max_uid={max_uid})")
-                return []
-
-            # Find new UIDs since last check
-            new_uids = [u for u in all_uids if u > state['last_uid']]
-            if not new_uids:
-                return []
-
-            logger.info(f"Found {len(new_uids)} new emails (last_uid={state['last_uid']}, new_uids={new_uids})")
-            resp = client.fetch(new_uids, ['ENVELOPE', 'BODY.PEEK[]'])
-
-            # Update last_uid only if we successfully processed emails
-            state['last_uid'] = max_uid
-            save_state()
+# Parse a raw message into the dict used for notifications
+def parse_email(raw_email):
+    msg = BytesParser(policy=default).parsebytes(raw_email)
+
+    # Get sender
+    sender = decode_mime_header(msg.get('From', ''))
+
+    # Get subject
+    subject = decode_mime_header(msg.get('Subject', ''))
+    if not subject:
+        subject = "(без темы)"
 
-        emails = []
-        for uid, data in resp.items():
-            env = data.get(b'ENVELOPE')
-            raw_email = data.get(b'BODY[]')
+    # Get body content
+    body = ""
+    if msg.is_multipart():
+        for part in msg.walk():
+            content_type = part.get_content_type()
+            content_disposition = str(part.get("Content-Disposition"))
 
-            if not env or not raw_email:
+            # Skip attachments
+            if "attachment" in content_disposition:
                 continue
 
-            # Parse email
-            msg = BytesParser(policy=default).parsebytes(raw_email)
-
-            # Get sender
-            sender = decode_mime_header(msg.get('From', ''))
-
-            # Get subject
-            subject = decode_mime_header(msg.get('Subject', ''))
-            if not subject:
-                subject = "(без темы)"
-
-            # Get body content
-            body = ""
-            if msg.is_multipart():
-                for part in msg.walk():
-                    content_type = part.get_content_type()
-                    content_disposition = str(part.get("Content-Disposition"))
-
-                    # Skip attachments
-                    if "attachment" in content_disposition:
-                        continue
-
-                    if content_type == "text/plain":
-                        payload = part.get_payload(decode=True)
-                        if payload:
-                            try:
-                                charset = part.get_content_charset() or 'utf-8'
-                                body = payload.decode(charset, errors='replace')
-                            except:
-                                body = payload.decode('utf-8', errors='replace')
-                        break
-            else:
-                payload = msg.get_payload(decode=True)
+            if content_type == "text/plain":
+                payload = part.get_payload(decode=True)
                 if payload:
                     try:
-                        charset = msg.get_content_charset() or 'utf-8'
+                        charset = part.get_content_charset() or 'utf-8'
                         body = payload.decode(charset, errors='replace')
                     except:
                         body = payload.decode('utf-8', errors='replace')
+                break
+    else:
+        payload = msg.get_payload(decode=True)
+        if payload:
+            try:
+                charset = msg.get_content_charset() or 'utf-8'
+                body = payload.decode(charset, errors='replace')
+            except:
+                body = payload.decode('utf-8', errors='replace')
+
+    # Clean up content
+    subject = re.sub(r'\s+', ' ', subject).strip()
+    sender = re.sub(r'\s+', ' ', sender).strip()
+    body = re.sub(r'\s+', ' ', body).strip()
+
+    # Limit body length for display
+    if len(body) > 300:
+        body = body[:300] + "..."
+
+    return {
+        'sender': sender,
+        'subject': subject,
+        'body': body
+    }
+
+
+# Fetch and parse messages newer than last_uid, returns (emails, max_uid)
+def fetch_new_emails(host, user, password, last_uid):
+    with IMAPClient(host, ssl=True, timeout=IMAP_TIMEOUT) as client:
+        client.login(user, password)
+        client.select_folder('INBOX')
+        all_uids = client.search(['ALL'])
+
+        # New mailbox: start from the current inbox instead of resending its history
+        if last_uid is None:
+            max_uid = max(all_uids) if all_uids else 0
+            logger.info(f"Baseline for {user} set to UID {max_uid}, older emails are skipped")
+            return [], max_uid
+
+        if not all_uids:
+            logger.info(f"No emails found in inbox {user}")
+            return [], last_uid
+
+        # Get highest UID to update last_uid
+        max_uid = max(all_uids)
+        if max_uid <= last_uid:
+            logger.info(f"No new emails in {user} since last check (last_uid={last_uid}, max_uid={max_uid})")
+            return [], last_uid
+
+        # Find new UIDs since last check
+        new_uids = [u for u in all_uids if u > last_uid]
+        if not new_uids:
+            return [], last_uid
+
+        logger.info(f"Found {len(new_uids)} new emails in {user} (last_uid={last_uid}, new_uids={new_uids})")
+        resp = client.fetch(new_uids, ['ENVELOPE', 'BODY.PEEK[]'])
+
+    emails = []
+    for uid, data in resp.items():
+        env = data.get(b'ENVELOPE')
+        raw_email = data.get(b'BODY[]')
+
+        if not env or not raw_email:
+            continue
+
+        # A malformed message must not block the mailbox: report it and move on
+        try:
+            emails.append(parse_email(raw_email))
+        except Exception as e:
+            logger.error(f"Could not parse email UID {uid} in {user}: {str(e)}", exc_info=True)
+            emails.append({
+                'sender': "(неизвестно)",
+                'subject': f"(не удалось разобрать письмо, UID {uid})",
+                'body': ""
+            })
 
-            # Clean up content
-            subject = re.sub(r'\s+', ' ', subject).strip()
-            sender = re.sub(r'\s+', ' ', sender).strip()
-            body = re.sub(r'\s+', ' ', body).strip()
+    return emails, max_uid
 
-            # Limit body length for display
-            if len(body) > 300:
-                body = body[:300] + "..."
 
-            emails.append({
-                'sender': sender,
-                'subject': subject,
-                'body': body
-            })
+# Mail checker logic
+def check_mail():
+    global state
+    try:
+        emails, max_uid = fetch_new_emails(IMAP_HOST, IMAP_USER, IMAP_PASS, state['last_uid'])
+
+        # Update last_uid only if we successfully processed emails
+        if max_uid > state['last_uid']:
+            state['last_uid'] = max_uid
+            save_state()
 
         return emails
 
@@ -202,29 +250,389 @@ def check_mail():
         return []
 
 
+# Mailboxes handled in sharded mode: MAILBOXES_FILE or the single IMAP_USER
+def load_mailboxes():
+    if MAILBOXES_FILE:
+        with open(MAILBOXES_FILE, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        return {
+            entry['user']: {
+                'user': entry['user'],
+                'password': entry['password'],
+                'host': entry.get('host', IMAP_HOST)
+            }
+            for entry in entries
+        }
+    if IMAP_USER:
+        return {IMAP_USER: {'user': IMAP_USER, 'password': IMAP_PASS, 'host': IMAP_HOST}}
+    return {}
+
+
+# Shared store (SQLite in WAL mode) used by the front process and workers
+def db_connect():
+    conn = sqlite3.connect(SHARD_DB, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def init_store(mailboxes):
+    conn = db_connect()
+    try:
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS mailboxes (
+                user TEXT PRIMARY KEY,
+                last_uid INTEGER,
+                owner TEXT,
+                lease_until REAL NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS workers (
+                worker_id TEXT PRIMARY KEY,
+                heartbeat REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                mailbox TEXT NOT NULL,
+                sender TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                body TEXT NOT NULL,
+                claim TEXT,
+                claimed_at REAL NOT NULL DEFAULT 0
+            );
+        """)
+        conn.execute('BEGIN IMMEDIATE')
+        for user in mailboxes:
+            # Carry over single-mailbox progress (also after running with WORKERS=0),
+            # other mailboxes are baselined on first check
+            last_uid = (state['last_uid'] or None) if user == IMAP_USER else None
+            conn.execute(
+                'INSERT INTO mailboxes (user, last_uid) VALUES (?, ?) '
+                'ON CONFLICT(user) DO UPDATE SET last_uid = MAX(COALESCE(last_uid, 0), excluded.last_uid) '
+                'WHERE excluded.last_uid IS NOT NULL',
+                (user, last_uid)
+            )
+        placeholders = ','.join('?' * len(mailboxes))
+        conn.execute(f'DELETE FROM mailboxes WHERE user NOT IN ({placeholders})', list(mailboxes))
+        # Only this process delivers, so claims left by a previous run are stale
+        conn.execute('UPDATE outbox SET claim = NULL, claimed_at = 0')
+        # Register every worker up front so the ring is stable from the first claim
+        now = time.time()
+        conn.execute('DELETE FROM workers')
+        conn.executemany(
+            'INSERT INTO workers (worker_id, heartbeat) VALUES (?, ?)',
+            [(f"worker-{i}", now) for i in range(WORKERS)]
+        )
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+    logger.info(f"Shard store ready: {len(mailboxes)} mailboxes in {SHARD_DB}")
+
+
+# Consistent hashing of mailboxes onto live workers
+def ring_hash(key):
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+
+def build_ring(worker_ids):
+    return sorted(
+        (ring_hash(f"{worker_id}#{i}"), worker_id)
+        for worker_id in worker_ids
+        for i in range(RING_REPLICAS)
+    )
+
+
+def ring_owner(ring, key):
+    if not ring:
+        return None
+    idx = bisect(ring, (ring_hash(key),)) % len(ring)
+    return ring[idx][1]
+
+
+# worker_id is the ring slot, owner the lease token of this worker incarnation
+def claim_mailboxes(conn, worker_id, owner):
+    now = time.time()
+    owned = []
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(
+            'INSERT INTO workers (worker_id, heartbeat) VALUES (?, ?) '
+            'ON CONFLICT(worker_id) DO UPDATE SET heartbeat = excluded.heartbeat',
+            (worker_id, now)
+        )
+        live = [row['worker_id'] for row in conn.execute(
+            'SELECT worker_id FROM workers WHERE heartbeat > ?', (now - LEASE_TTL,)
+        )]
+        ring = build_ring(live)
+
+        for row in conn.execute('SELECT user, last_uid, owner, lease_until FROM mailboxes').fetchall():
+            if ring_owner(ring, row['user']) != worker_id:
+                # Slice moved to another worker: hand the lease over
+                if row['owner'] == owner:
+                    conn.execute(
+                        'UPDATE mailboxes SET owner = NULL, lease_until = 0 WHERE user = ?',
+                        (row['user'],)
+                    )
+                continue
+
+            # Wait for the previous owner's lease to run out
+            if row['owner'] not in (None, owner) and row['lease_until'] > now:
+                continue
+
+            conn.execute(
+                'UPDATE mailboxes SET owner = ?, lease_until = ? WHERE user = ?',
+                (owner, now + LEASE_TTL, row['user'])
+            )
+            owned.append({'user': row['user'], 'last_uid': row['last_uid']})
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return owned
+
+
+def record_result(conn, worker_id, owner, user, max_uid, emails):
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        cur = conn.execute(
+            'UPDATE mailboxes SET last_uid = ?, lease_until = ? WHERE user = ? AND owner = ?',
+            (max_uid, now + LEASE_TTL, user, owner)
+        )
+        # Lease lost meanwhile: the new owner re-fetches from the stored last_uid
+        if cur.rowcount:
+            conn.executemany(
+                'INSERT INTO outbox (mailbox, sender, subject, body) VALUES (?, ?, ?, ?)',
+                [(user, e['sender'], e['subject'], e['body']) for e in emails]
+            )
+        else:
+            logger.warning(f"Worker {worker_id} lost lease on {user}, dropping {len(emails)} emails")
+        conn.execute('UPDATE workers SET heartbeat = ? WHERE worker_id = ?', (now, worker_id))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def renew_leases(conn, worker_id, owner):
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('UPDATE workers SET heartbeat = ? WHERE worker_id = ?', (now, worker_id))
+        conn.execute(
+            'UPDATE mailboxes SET lease_until = ? WHERE owner = ?',
+            (now + LEASE_TTL, owner)
+        )
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+# Keeps heartbeat and leases fresh while long fetches are running,
+# but lets them expire once the worker stops making progress (hung worker)
+def lease_keeper(worker_id, owner, progress, stop):
+    conn = db_connect()
+    try:
+        while not stop.wait(LEASE_TTL / 4):
+            if time.monotonic() - progress['at'] > LEASE_TTL:
+                logger.warning(f"Worker {worker_id} made no progress for {LEASE_TTL}s, letting leases expire")
+                continue
+            try:
+                renew_leases(conn, worker_id, owner)
+            except Exception as e:
+                logger.error(f"Worker {worker_id} lease renewal error: {str(e)}")
+    finally:
+        conn.close()
+
+
+# Worker process: checks and parses its slice of mailboxes
+def run_worker(worker_id):
+    mailboxes = load_mailboxes()
+    conn = db_connect()
+    # A fresh token per incarnation, so an orphan of a killed bot cannot share leases
+    owner = f"{worker_id}:{uuid.uuid4().hex}"
+    parent = multiprocessing.parent_process()
+    progress = {'at': time.monotonic()}
+    stop = threading.Event()
+    keeper = threading.Thread(target=lease_keeper, args=(worker_id, owner, progress, stop), daemon=True)
+
+    def check_leased(leased):
+        mailbox = mailboxes.get(leased['user'])
+        if mailbox is None:
+            return None
+        try:
+            return fetch_new_emails(mailbox['host'], mailbox['user'], mailbox['password'], leased['last_uid'])
+        except Exception as e:
+            logger.error(f"Mail check error for {leased['user']}: {str(e)}", exc_info=True)
+            return None
+        finally:
+            progress['at'] = time.monotonic()
+
+    logger.info(f"Worker {worker_id} started")
+    keeper.start()
+    try:
+        with ThreadPoolExecutor(max_workers=WORKER_THREADS) as pool:
+            while True:
+                # Daemon workers survive a SIGKILLed bot process: exit on our own
+                if parent is not None and not parent.is_alive():
+                    logger.warning(f"Worker {worker_id} lost its parent process, exiting")
+                    break
+
+                started = time.monotonic()
+                try:
+                    owned = claim_mailboxes(conn, worker_id, owner)
+                    progress['at'] = time.monotonic()
+                    for leased, result in zip(owned, pool.map(check_leased, owned)):
+                        if result is None:
+                            continue
+                        emails, max_uid = result
+                        record_result(conn, worker_id, owner, leased['user'], max_uid, emails)
+                        progress['at'] = time.monotonic()
+                except Exception as e:
+                    logger.error(f"Worker {worker_id} error: {str(e)}", exc_info=True)
+                time.sleep(max(0, WORKER_POLL - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        conn.close()
+        logger.info(f"Worker {worker_id} stopped")
+
+
+# Front process side of sharded mode
+worker_processes = []
+
+
+def start_worker(index):
+    ctx = multiprocessing.get_context('spawn')
+    proc = ctx.Process(target=run_worker, args=(f"worker-{index}",), name=f"worker-{index}", daemon=True)
+    proc.start()
+    return proc
+
+
+async def supervise_workers(context: ContextTypes.DEFAULT_TYPE):
+    for i, proc in enumerate(worker_processes):
+        if not proc.is_alive():
+            logger.warning(f"Worker {proc.name} exited with code {proc.exitcode}, restarting")
+            worker_processes[i] = start_worker(i)
+
+
+# Mirror IMAP_USER progress into state so WORKERS=0 resumes without resending
+def sync_state_from_store(conn):
+    row = conn.execute(
+        'SELECT last_uid, '
+        '(SELECT COUNT(*) FROM outbox WHERE mailbox = mailboxes.user) AS pending '
+        'FROM mailboxes WHERE user = ?',
+        (IMAP_USER,)
+    ).fetchone()
+
+    # Undelivered emails keep the older UID: resending beats losing them
+    if row is None or row['last_uid'] is None or row['pending']:
+        return
+    if row['last_uid'] != state['last_uid']:
+        state['last_uid'] = row['last_uid']
+        save_state()
+
+
+# Claim a batch of undelivered emails; each one is deleted only after a successful send.
+# The rest of the backlog goes out on the next realtime/periodic run.
+def claim_outbox():
+    token = uuid.uuid4().hex
+    now = time.time()
+    conn = db_connect()
+    try:
+        sync_state_from_store(conn)
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute(
+            'UPDATE outbox SET claim = ?, claimed_at = ? WHERE id IN ('
+            'SELECT id FROM outbox WHERE claim IS NULL OR claimed_at < ? ORDER BY id LIMIT ?)',
+            (token, now, now - OUTBOX_CLAIM_TTL, OUTBOX_BATCH)
+        )
+        rows = conn.execute(
+            'SELECT id, mailbox, sender, subject, body FROM outbox WHERE claim = ? ORDER BY id',
+            (token,)
+        ).fetchall()
+        conn.execute('COMMIT')
+        return [
+            {
+                'id': row['id'],
+                'mailbox': row['mailbox'],
+                'sender': row['sender'],
+                'subject': row['subject'],
+                'body': row['body']
+            }
+            for row in rows
+        ]
+    except Exception as e:
+        logger.error(f"Outbox claim error: {str(e)}", exc_info=True)
+        return []
+    finally:
+        conn.close()
+
+
+def finish_delivery(outbox_id, delivered):
+    conn = db_connect()
+    try:
+        if delivered:
+            conn.execute('DELETE FROM outbox WHERE id = ?', (outbox_id,))
+        else:
+            conn.execute('UPDATE outbox SET claim = NULL, claimed_at = 0 WHERE id = ?', (outbox_id,))
+    except Exception as e:
+        logger.error(f"Outbox update error: {str(e)}", exc_info=True)
+    finally:
+        conn.close()
+
+
+# New emails: workers' outbox in sharded mode, direct IMAP check otherwise
+async def collect_emails():
+    if WORKERS > 0:
+        return await asyncio.to_thread(claim_outbox)
+    return await asyncio.to_thread(check_mail)
+
+
+def format_email(email_info):
+    text = ""
+    if email_info.get('mailbox'):
+        text += f"📥 Ящик: {email_info['mailbox']}\n"
+    text += (
+        f"✉️ От: {email_info['sender']}\n"
+        f"📌 Тема: {email_info['subject']}\n"
+        f"📝 Содержание:\n{email_info['body']}"
+    )
+    return text
+
+
+# Send emails one by one, acknowledging outbox entries only when delivered
+async def send_emails(context, emails, header, error_label):
+    for email_info in emails:
+        try:
+            await context.bot.send_message(
+                chat_id=CHAT_ID,
+                text=f"{header}\n{format_email(email_info)}",
+                reply_markup=ReplyKeyboardMarkup([["/start"]], resize_keyboard=True)
+            )
+            delivered = True
+        except Exception as e:
+            logger.error(f"{error_label} error: {str(e)}")
+            delivered = False
+
+        if 'id' in email_info:
+            await asyncio.to_thread(finish_delivery, email_info['id'], delivered)
+
+
 # Real-time mail checker
 async def realtime_check(context: ContextTypes.DEFAULT_TYPE):
     if not state['realtime']:
         return
 
     logger.info("Running realtime check")
-    emails = await asyncio.to_thread(check_mail)
+    emails = await collect_emails()
     if emails:
-        for email_info in emails:
-            text = (
-                f"🔔 СРОЧНО!\n"
-                f"✉️ От: {email_info['sender']}\n"
-                f"📌 Тема: {email_info['subject']}\n"
-                f"📝 Содержание:\n{email_info['body']}"
-            )
-            try:
-                await context.bot.send_message(
-                    chat_id=CHAT_ID,
-                    text=text,
-                    reply_markup=ReplyKeyboardMarkup([["/start"]], resize_keyboard=True)
-                )
-            except Exception as e:
-                logger.error(f"Realtime notify error: {str(e)}")
+        await send_emails(context, emails, "🔔 СРОЧНО!", "Realtime notify")
 
 
 # Notification routines
@@ -248,43 +656,17 @@ async def notify_periodic(context: ContextTypes.DEFAULT_TYPE):
         return
 
     logger.info("Running periodic check")
-    emails = await asyncio.to_thread(check_mail)
+    emails = await collect_emails()
     if emails:
-        for email_info in emails:
-            text = (
-                f"✉️ От: {email_info['sender']}\n"
-                f"📌 Тема: {email_info['subject']}\n"
-                f"📝 Содержание:\n{email_info['body']}"
-            )
-            try:
-                await context.bot.send_message(
-                    chat_id=CHAT_ID,
-                    text=f"[Авто] Новое письмо\n{text}",
-                    reply_markup=ReplyKeyboardMarkup([["/start"]], resize_keyboard=True)
-                )
-            except Exception as e:
-                logger.error(f"Periodic notify error: {str(e)}")
+        await send_emails(context, emails, "[Авто] Новое письмо", "Periodic notify")
 
 
 # Daily summary at 8:00
 async def daily_report(context: ContextTypes.DEFAULT_TYPE):
     logger.info("Running daily report")
-    emails = await asyncio.to_thread(check_mail)
+    emails = await collect_emails()
     if emails:
-        for email_info in emails:
-            text = (
-                f"✉️ От: {email_info['sender']}\n"
-                f"📌 Тема: {email_info['subject']}\n"
-                f"📝 Содержание:\n{email_info['body']}"
-            )
-            try:
-                await context.bot.send_message(
-                    chat_id=CHAT_ID,
-                    text=f"[Дневной отчет]\n{text}",
-                    reply_markup=ReplyKeyboardMarkup([["/start"]], resize_keyboard=True)
-                )
-            except Exception as e:
-                logger.error(f"Daily report error: {str(e)}")
+        await send_emails(context, emails, "[Дневной отчет]", "Daily report")
     else:
         try:
             await context.bot.send_message(
@@ -318,20 +700,10 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def check_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handler for /check command"""
     logger.info("Manual check requested via command")
-    emails = await asyncio.to_thread(check_mail)
+    emails = await collect_emails()
 
     if emails:
-        for email_info in emails:
-            text = (
-                f"✉️ От: {email_info['sender']}\n"
-                f"📌 Тема: {email_info['subject']}\n"
-                f"📝 Содержание:\n{email_info['body']}"
-            )
-            await context.bot.send_message(
-                chat_id=CHAT_ID,
-                text=f"[Ручная проверка]\n{text}",
-                reply_markup=ReplyKeyboardMarkup([["/start"]], resize_keyboard=True)
-            )
+        await send_emails(context, emails, "[Ручная проверка]", "Manual check notify")
     else:
         await context.bot.send_message(
             chat_id=CHAT_ID,
@@ -354,20 +726,10 @@ async def check_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.warning(f"Could not delete message: {e}")
 
     logger.info("Manual check requested via button")
-    emails = await asyncio.to_thread(check_mail)
+    emails = await collect_emails()
 
     if emails:
-        for email_info in emails:
-            text = (
-                f"✉️ От: {email_info['sender']}\n"
-                f"📌 Тема: {email_info['subject']}\n"
-                f"📝 Содержание:\n{email_info['body']}"
-            )
-            await context.bot.send_message(
-                chat_id=CHAT_ID,
-                text=f"[Ручная проверка]\n{text}",
-                reply_markup=ReplyKeyboardMarkup([["/start"]], resize_keyboard=True)
-            )
+        await send_emails(context, emails, "[Ручная проверка]", "Manual check notify")
     else:
         await context.bot.send_message(
             chat_id=CHAT_ID,
@@ -659,6 +1021,20 @@ if __name__ == '__main__':
         name='daily'
     )
 
+    # Sharded mode: worker processes check mail, this process only delivers
+    if WORKERS > 0:
+        init_store(load_mailboxes())
+        for i in range(WORKERS):
+            worker_processes.append(start_worker(i))
+
+        app.job_queue.run_repeating(
+            supervise_workers,
+            interval=30,  # seconds
+            first=30,
+            name='supervise'
+        )
+        logger.info(f"Started {WORKERS} mail workers")
+
     logger.info("Bot started with simplified realtime support")
     logger.info(f"Initial state: {state}")
 